@@ -0,0 +1,31 @@
+from setuptools import setup, find_namespace_packages
+
+
+with open('README.md', encoding='utf-8') as f:
+    readme = f.read()
+
+
+setup(
+    name='classic-locks',
+    version='0.3.0',
+    description='Primitives for distributed locking of abstract resources',
+    long_description=readme,
+    long_description_content_type='text/markdown',
+    url='https://github.com/variasov/classic_locks',
+    author='Sergei Variasov',
+    author_email='variasov@gmail.com',
+    license='MIT',
+    package_dir={'': 'sources'},
+    packages=find_namespace_packages('sources'),
+    python_requires='>=3.8',
+    install_requires=[
+        'classic-components>=1.0.0',
+    ],
+    extras_require={
+        'postgres': ['psycopg2'],
+        'mssql': ['pymssql'],
+        'sqlalchemy': ['sqlalchemy'],
+        'fasthash': ['xxhash'],
+        'dev': ['pytest', 'pytest-xdist'],
+    },
+)
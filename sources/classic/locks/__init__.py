@@ -0,0 +1,8 @@
+from .context_manager import locking
+from .errors import ResourceIsLocked
+from .file_locker import FileLock, FileLocker
+from .lock import (
+    EXCLUSIVE, SESSION, SHARED, TRANSACTION,
+    AcquireLock, Lock, LockType, ScopeType,
+)
+from . import errors
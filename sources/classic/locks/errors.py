@@ -0,0 +1,10 @@
+class ResourceIsLocked(Exception):
+
+    __slots__ = ('resource',)
+
+    def __init__(self, resource: str):
+        super().__init__(resource)
+        self.resource = resource
+
+    def __str__(self):
+        return 'Resource "{}" is locked'.format(self.resource)
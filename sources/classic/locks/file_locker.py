@@ -0,0 +1,201 @@
+import fcntl
+import os
+import random
+import signal
+import threading
+import time
+from typing import Optional
+
+from . import errors
+from .lock import (
+    EXCLUSIVE, SESSION, AcquireLock, Lock, LockType, ScopeType,
+)
+
+
+LOCK_FN_MAP = {
+    LockType.SHARED: fcntl.LOCK_SH,
+    LockType.EXCLUSIVE: fcntl.LOCK_EX,
+}
+
+
+class FileLock(Lock):
+
+    # Объект создается на каждый захват; __slots__ убирает __dict__
+    # и заметно снижает нагрузку на аллокатор под большим потоком.
+    __slots__ = (
+        'fd', 'file', 'lock_fn', 'lock_type', 'resource',
+        'timeout', 'timeout_delay',
+    )
+
+    def __init__(
+        self,
+        file: str,
+        lock_fn: int,
+        lock_type: LockType,
+        resource: str,
+        timeout: Optional[int] = None,
+        timeout_delay: float = 0.5,
+    ):
+        self.file = file
+        self.lock_fn = lock_fn
+        self.lock_type = lock_type
+        self.resource = resource
+        self.timeout = timeout
+        self.timeout_delay = timeout_delay
+        self.fd = None
+
+    def __enter__(self):
+        # Дескриптор у каждого захвата свой: flock на общем fd — это
+        # конверсия уже удержанной блокировки, и два потока одного
+        # процесса «захватили» бы один ресурс одновременно.
+        # O_CLOEXEC: дескриптор не утекает в дочерние процессы.
+        self.fd = os.open(
+            self.file, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644,
+        )
+        try:
+            if self.timeout is not None and self.timeout <= 0:
+                self.__acquire_nonblocking()
+            elif self.timeout is None:
+                # Ядро само будит процесс в момент освобождения
+                # блокировки, опрос не нужен. EINTR повторяется
+                # интерпретатором (PEP 475).
+                fcntl.flock(self.fd, self.lock_fn)
+            elif threading.current_thread() is threading.main_thread():
+                self.__acquire_with_alarm()
+            else:
+                # SIGALRM доступен только в главном потоке.
+                self.__acquire_polling()
+        except BaseException:
+            fd, self.fd = self.fd, None
+            os.close(fd)
+            raise
+        return self
+
+    def __acquire_nonblocking(self):
+        try:
+            fcntl.flock(self.fd, self.lock_fn | fcntl.LOCK_NB)
+        except OSError:
+            raise errors.ResourceIsLocked(resource=self.resource)
+
+    def __acquire_with_alarm(self):
+
+        def handle_alarm(signum, frame):
+            raise InterruptedError
+
+        old_handler = signal.signal(signal.SIGALRM, handle_alarm)
+        signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        try:
+            fcntl.flock(self.fd, self.lock_fn)
+        except InterruptedError:
+            raise errors.ResourceIsLocked(resource=self.resource)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, old_handler)
+
+    def __acquire_polling(self):
+        start_time = time.monotonic()
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(self.fd, self.lock_fn | fcntl.LOCK_NB)
+                break
+            except InterruptedError:
+                # EINTR не считается против бюджета времени.
+                continue
+            except OSError:
+                if time.monotonic() - start_time > self.timeout:
+                    raise errors.ResourceIsLocked(resource=self.resource)
+                time.sleep(delay + random.uniform(0, delay * 0.1))
+                delay = min(delay * 2, self.timeout_delay)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        fd, self.fd = self.fd, None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class FileLocker(AcquireLock):
+    """Блокировки через файлы с fcntl.flock. Только для Linux."""
+
+    def __init__(
+        self,
+        path: str,
+        extension: str = '.lock',
+        cleaner_delay: int = 600,
+        timeout_delay: float = 0.5,
+    ):
+        self.path = path
+        self.extension = extension
+        self.cleaner_delay = cleaner_delay
+        self.timeout_delay = timeout_delay
+        os.makedirs(self.path, exist_ok=True)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(
+        self,
+        resource: str,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+    ) -> FileLock:
+        lock_fn = LOCK_FN_MAP[lock_type]
+        if not block:
+            timeout = 0
+        file = os.path.join(self.path, resource + self.extension)
+        return FileLock(
+            file, lock_fn, lock_type, resource,
+            timeout, self.timeout_delay,
+        )
+
+    __call__ = acquire
+
+    def run_cleaner(self, background: bool = False):
+        if background:
+            self._thread = threading.Thread(
+                target=self.__loop, daemon=True, name='FileLocker-cleaner',
+            )
+            self._thread.start()
+        else:
+            self.__remove_files()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def __loop(self):
+        while not self._stop.is_set():
+            self.__remove_files()
+            # Event.wait вместо time.sleep: stop() будит поток сразу.
+            self._stop.wait(self.cleaner_delay)
+
+    def __remove_files(self):
+        # Файлы моложе двух периодов очистки заведомо не устарели:
+        # для них не нужны open/flock/unlink, достаточно stat
+        # (scandir отдает его из кэша каталога почти бесплатно).
+        threshold = time.time() - self.cleaner_delay * 2
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if not entry.name.endswith(self.extension):
+                    continue
+                try:
+                    if entry.stat().st_mtime > threshold:
+                        continue
+                except OSError:
+                    continue
+                try:
+                    fd = os.open(entry.path, os.O_RDWR | os.O_CLOEXEC)
+                except OSError:
+                    continue
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                finally:
+                    os.close(fd)
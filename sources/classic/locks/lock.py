@@ -0,0 +1,75 @@
+from abc import ABC, abstractmethod
+from enum import IntEnum
+from typing import Optional
+
+
+class LockType(IntEnum):
+    """Сравнение типов — целочисленное, в отличие от Literal-строк."""
+
+    EXCLUSIVE = 1
+    SHARED = 2
+
+    def __str__(self):
+        return self.name
+
+
+class ScopeType(IntEnum):
+
+    TRANSACTION = 1
+    SESSION = 2
+
+    def __str__(self):
+        return self.name
+
+
+EXCLUSIVE = LockType.EXCLUSIVE
+SHARED = LockType.SHARED
+
+TRANSACTION = ScopeType.TRANSACTION
+SESSION = ScopeType.SESSION
+
+
+class Lock(ABC):
+    """Контекстный менеджер, удерживающий блокировку ресурса."""
+
+    # Пустые __slots__ позволяют наследникам отказаться от __dict__.
+    __slots__ = ()
+
+    @abstractmethod
+    def __enter__(self):
+        ...
+
+    @abstractmethod
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        ...
+
+
+class AsyncLock(ABC):
+    """Асинхронный вариант Lock: ожидание не блокирует event loop."""
+
+    __slots__ = ()
+
+    @abstractmethod
+    async def __aenter__(self):
+        ...
+
+    @abstractmethod
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        ...
+
+
+class AcquireLock(ABC):
+    """Фабрика блокировок. Вызов возвращает Lock для ресурса."""
+
+    __slots__ = ()
+
+    @abstractmethod
+    def __call__(
+        self,
+        resource: str,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+    ) -> Lock:
+        ...
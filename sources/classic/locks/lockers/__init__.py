@@ -0,0 +1,6 @@
+from ..lock import (
+    EXCLUSIVE, SESSION, SHARED, TRANSACTION, Lock, LockType, ScopeType,
+)
+from .context_manager import locking
+from .mssql_locker import MSAdvisoryLock, MSAdvisoryLocker
+from .postgres_locker import PGAdvisoryLock, PGAdvisoryLocker
@@ -0,0 +1,4 @@
+from ..context_manager import compile_resource, locking
+
+
+__all__ = ('compile_resource', 'locking')
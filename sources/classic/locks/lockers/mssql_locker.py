@@ -0,0 +1,129 @@
+from typing import Optional
+
+from .. import errors
+from ..lock import (
+    EXCLUSIVE, SESSION, SHARED, TRANSACTION, Lock, LockType, ScopeType,
+)
+from ..mssql_getapplock import GETAPPLOCK_PROC, ensure_getapplock_proc
+
+
+OWNER_TYPE_TRANSACTION = 'Transaction'
+OWNER_TYPE_SESSION = 'Session'
+
+
+class MSAdvisoryLock(Lock):
+
+    def __init__(
+        self,
+        connection,
+        resource: str,
+        lock_mode: str,
+        timeout: int,
+        lock_owner: str,
+        database_principal: str = 'public',
+    ):
+        self.connection = connection
+        self.resource = resource
+        self.lock_mode = lock_mode
+        self.timeout = timeout
+        self.lock_owner = lock_owner
+        self.database_principal = database_principal
+
+    def __enter__(self):
+        params = (
+            self.database_principal, self.resource,
+            self.lock_mode, self.lock_owner, self.timeout,
+        )
+        with self.connection.cursor() as cursor:
+            # Через обертку-процедуру батч DECLARE/EXEC/SELECT
+            # не парсится сервером на каждый захват; без прав
+            # на нее остается прежний батч.
+            if ensure_getapplock_proc(self.connection, cursor):
+                cursor.callproc(GETAPPLOCK_PROC, params)
+            else:
+                cursor.execute(
+                    """
+                    DECLARE @result int;
+                    EXEC @result = sp_getapplock
+                        @DbPrincipal=%s,
+                        @Resource=%s,
+                        @LockMode=%s,
+                        @LockOwner=%s,
+                        @LockTimeout=%d;
+                    SELECT @result;
+                    """,
+                    params,
+                )
+            result = cursor.fetchone()[0]
+        if result < 0:
+            raise errors.ResourceIsLocked(resource=self.resource)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.lock_owner == OWNER_TYPE_TRANSACTION:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                EXEC sp_releaseapplock
+                    @DbPrincipal=%s,
+                    @Resource=%s,
+                    @LockOwner=%s;
+                """,
+                (self.database_principal, self.resource, self.lock_owner),
+            )
+
+
+class MSAdvisoryLocker:
+
+    def __init__(
+        self,
+        connection,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+        lock_mode: Optional[str] = None,
+        database_principal: str = 'public',
+    ):
+        self.connection = connection
+        self.block = block
+        self.timeout = timeout
+        self.lock_type = lock_type
+        self.scope = scope
+        self.lock_mode = lock_mode
+        self.database_principal = database_principal
+
+    def acquire(
+        self,
+        resource: str,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> MSAdvisoryLock:
+        block = block if block is not None else self.block
+        timeout = timeout or self.timeout
+        if timeout is not None and timeout > 0:
+            timeout = int(timeout * 1000)
+        elif not block:
+            timeout = 0
+        else:
+            timeout = -1
+        lock_type = lock_type or self.lock_type
+        scope = scope or self.scope
+        return MSAdvisoryLock(
+            self.connection,
+            resource,
+            self.lock_mode or (
+                'Shared' if lock_type == SHARED else 'Exclusive'
+            ),
+            timeout,
+            (
+                OWNER_TYPE_TRANSACTION
+                if scope == TRANSACTION else OWNER_TYPE_SESSION
+            ),
+            self.database_principal,
+        )
+
+    __call__ = acquire
@@ -0,0 +1,190 @@
+import random
+import struct
+import time
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Optional
+
+from .. import errors
+from ..lock import (
+    EXCLUSIVE, SESSION, SHARED, TRANSACTION, Lock, LockType, ScopeType,
+)
+
+
+WAIT_QUERY = 'wait'
+TRY_QUERY = 'try'
+
+LOCK_FN_QUERY_TYPE_MAP = {
+    'pg_advisory_lock': WAIT_QUERY,
+    'pg_advisory_lock_shared': WAIT_QUERY,
+    'pg_advisory_xact_lock': WAIT_QUERY,
+    'pg_advisory_xact_lock_shared': WAIT_QUERY,
+    'pg_try_advisory_lock': TRY_QUERY,
+    'pg_try_advisory_lock_shared': TRY_QUERY,
+    'pg_try_advisory_xact_lock': TRY_QUERY,
+    'pg_try_advisory_xact_lock_shared': TRY_QUERY,
+}
+
+# Запросы к фиксированному набору функций собираются при импорте:
+# в цикле ожидания остается только выборка атрибута.
+LOCK_SQL = {
+    fn: 'SELECT {}(%s)'.format(fn)
+    for fn in LOCK_FN_QUERY_TYPE_MAP
+}
+UNLOCK_SQL = {
+    fn: 'SELECT {}(%s)'.format(fn)
+    for fn in ('pg_advisory_unlock', 'pg_advisory_unlock_shared')
+}
+
+
+# Одни и те же имена ресурсов запрашиваются постоянно — хэш считается
+# один раз, повторные обращения обходятся поиском в словаре кэша.
+_INT8_LE = struct.Struct('<q').unpack
+
+
+@lru_cache(maxsize=4096)
+def get_resource_id(resource: str) -> int:
+    # digest_size=8: BLAKE2b отдает ровно нужные 8 байт, без
+    # вычисления и отбрасывания остальных 56.
+    digest = blake2b(resource.encode('utf-8'), digest_size=8).digest()
+    return _INT8_LE(digest)[0]
+
+
+class PGAdvisoryLock(Lock):
+
+    __slots__ = (
+        'connection', 'resource', 'resource_id', 'lock_fn', 'unlock_fn',
+        'is_wait_query', 'lock_sql', 'unlock_sql', 'timeout', 'delay',
+        'cursor',
+    )
+
+    def __init__(
+        self,
+        connection,
+        resource: str,
+        resource_id: int,
+        lock_fn: str,
+        unlock_fn: Optional[str],
+        timeout: Optional[int] = None,
+        delay: float = 0.5,
+    ):
+        self.connection = connection
+        self.resource = resource
+        self.resource_id = resource_id
+        self.lock_fn = lock_fn
+        self.unlock_fn = unlock_fn
+        # Булево свойство lock_fn считается один раз, а не
+        # сравнением строк на каждой итерации цикла.
+        self.is_wait_query = (
+            LOCK_FN_QUERY_TYPE_MAP[lock_fn] == WAIT_QUERY
+        )
+        self.lock_sql = LOCK_SQL[lock_fn]
+        self.unlock_sql = UNLOCK_SQL[unlock_fn] if unlock_fn else None
+        self.timeout = timeout
+        self.delay = delay
+        self.cursor = None
+
+    def __enter__(self):
+        self.cursor = self.connection.cursor()
+        # Дедлайн держится в целых наносекундах: сравнение в цикле
+        # не трогает float-арифметику.
+        start_ns = time.monotonic_ns()
+        timeout_ns = (
+            int(self.timeout * 1_000_000_000) if self.timeout else 0
+        )
+        # Пауза растет экспоненциально от 5 мс до self.delay со случайной
+        # добавкой: конкуренты не просыпаются одновременно, а свободная
+        # блокировка не ждет фиксированные полсекунды.
+        backoff = min(0.005, self.delay)
+        while True:
+            self.cursor.execute(self.lock_sql, (self.resource_id,))
+            is_access = self.cursor.fetchone()[0]
+            if self.is_wait_query or is_access:
+                break
+            if (
+                not timeout_ns
+                or time.monotonic_ns() - start_ns > timeout_ns
+            ):
+                self.cursor.close()
+                raise errors.ResourceIsLocked(resource=self.resource)
+            time.sleep(backoff + random.uniform(0, backoff))
+            backoff = min(backoff * 2, self.delay)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.unlock_sql:
+            self.cursor.execute(self.unlock_sql, (self.resource_id,))
+        self.cursor.close()
+
+
+class PGAdvisoryLocker:
+
+    __slots__ = (
+        'connection', 'block', 'timeout', 'lock_type', 'scope', 'delay',
+    )
+
+    def __init__(
+        self,
+        connection,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+        delay: float = 0.5,
+    ):
+        self.connection = connection
+        self.block = block
+        self.timeout = timeout
+        self.lock_type = lock_type
+        self.scope = scope
+        self.delay = delay
+
+    @staticmethod
+    def __get_lock_fn(
+        block: bool,
+        lock_type: LockType,
+        scope: ScopeType,
+    ) -> str:
+        lock_fn = 'pg_'
+        if not block:
+            lock_fn += 'try_'
+        lock_fn += 'advisory_'
+        if scope == TRANSACTION:
+            lock_fn += 'xact_'
+        lock_fn += 'lock'
+        if lock_type == SHARED:
+            lock_fn += '_shared'
+        return lock_fn
+
+    @staticmethod
+    def __get_unlock_fn(lock_fn: str) -> Optional[str]:
+        if 'xact' in lock_fn:
+            return None
+        if lock_fn.endswith('_shared'):
+            return 'pg_advisory_unlock_shared'
+        return 'pg_advisory_unlock'
+
+    def acquire(
+        self,
+        resource: str,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> PGAdvisoryLock:
+        lock_fn = self.__get_lock_fn(
+            block if block is not None else self.block,
+            lock_type or self.lock_type,
+            scope or self.scope,
+        )
+        return PGAdvisoryLock(
+            self.connection,
+            resource,
+            get_resource_id(resource),
+            lock_fn,
+            self.__get_unlock_fn(lock_fn),
+            timeout or self.timeout,
+            self.delay,
+        )
+
+    __call__ = acquire
@@ -0,0 +1,55 @@
+from weakref import WeakKeyDictionary
+
+
+# Хранимая процедура-обертка: один вызов с закэшированным планом
+# вместо разбора трехоператорного батча DECLARE/EXEC/SELECT
+# на каждый захват. Модуль не тянет опциональных зависимостей —
+# им пользуются и pymssql-, и SQLAlchemy-локеры.
+GETAPPLOCK_PROC = 'dbo.classic_getapplock'
+
+CREATE_GETAPPLOCK_PROC_SQL = b"""
+    IF OBJECT_ID('dbo.classic_getapplock', 'P') IS NULL
+        EXEC('CREATE PROCEDURE dbo.classic_getapplock
+            @DbPrincipal sysname,
+            @Resource nvarchar(255),
+            @LockMode varchar(32),
+            @LockOwner varchar(32),
+            @LockTimeout int
+        AS
+        BEGIN
+            SET NOCOUNT ON;
+            DECLARE @result int;
+            EXEC @result = sp_getapplock
+                @DbPrincipal=@DbPrincipal,
+                @Resource=@Resource,
+                @LockMode=@LockMode,
+                @LockOwner=@LockOwner,
+                @LockTimeout=@LockTimeout;
+            SELECT @result;
+        END')
+"""
+
+_PROC_READY = WeakKeyDictionary()
+
+
+def ensure_getapplock_proc(connection, cursor) -> bool:
+    """Разворачивает обертку sp_getapplock, если ее еще нет.
+
+    Результат кэшируется по соединению. Если прав на CREATE PROCEDURE
+    нет, захват работает через обычный батч.
+    """
+    try:
+        ready = _PROC_READY.get(connection)
+    except TypeError:
+        ready = None
+    if ready is None:
+        try:
+            cursor.execute(CREATE_GETAPPLOCK_PROC_SQL)
+            ready = True
+        except Exception:
+            ready = False
+        try:
+            _PROC_READY[connection] = ready
+        except TypeError:
+            pass
+    return ready
@@ -0,0 +1,428 @@
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Any, Callable, Optional
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import errors
+from .lock import (
+    EXCLUSIVE, SESSION, SHARED, TRANSACTION,
+    AcquireLock, Lock, LockType, ScopeType,
+)
+from .mssql_getapplock import GETAPPLOCK_PROC, ensure_getapplock_proc
+
+
+OWNER_TYPE_TRANSACTION = 'Transaction'
+OWNER_TYPE_SESSION = 'Session'
+
+SCOPE_TO_OWNER = {
+    TRANSACTION: OWNER_TYPE_TRANSACTION,
+    SESSION: OWNER_TYPE_SESSION,
+}
+
+# SQL собирается один раз при импорте: повторный разбор текста запроса
+# и спецификации параметров на каждый захват не нужен. Для pymssql
+# константы хранятся как bytes, чтобы не перекодировать str -> utf-8
+# на каждый вызов.
+GETAPPLOCK_SQL = b"""
+    DECLARE @result int;
+    EXEC @result = sp_getapplock
+        @DbPrincipal=%s,
+        @Resource=%s,
+        @LockMode=%s,
+        @LockOwner=%s,
+        @LockTimeout=%d;
+    SELECT @result;
+"""
+
+RELEASEAPPLOCK_SQL = b"""
+    EXEC sp_releaseapplock
+        @DbPrincipal=%s,
+        @Resource=%s,
+        @LockOwner=%s;
+"""
+
+GETAPPLOCK_TEXT = text(
+    """
+    DECLARE @result int;
+    EXEC @result = sp_getapplock
+        @DbPrincipal=:principal,
+        @Resource=:resource,
+        @LockMode=:mode,
+        @LockOwner=:owner,
+        @LockTimeout=:timeout;
+    SELECT @result;
+    """
+)
+
+RELEASEAPPLOCK_TEXT = text(
+    """
+    EXEC sp_releaseapplock
+        @DbPrincipal=:principal,
+        @Resource=:resource,
+        @LockOwner=:owner;
+    """
+)
+
+
+def get_resource_key(resource: str) -> str:
+    """Стабильный 64-битный ключ ресурса для @Resource.
+
+    SQL Server хэширует строку @Resource на каждом захвате; короткий
+    числовой ключ, посчитанный один раз при создании блокировки,
+    дешевле и на сервере, и при передаче параметра.
+    """
+    digest = blake2b(resource.encode('utf-8'), digest_size=8).digest()
+    return str(int.from_bytes(digest, 'big', signed=True))
+
+
+@lru_cache(maxsize=64)
+def handle_timeout(timeout: Optional[int], block: bool) -> int:
+    # Подавляющее большинство вызовов — block=True без таймаута.
+    if block and timeout is None:
+        return -1
+    if timeout is not None and timeout > 0:
+        return int(timeout * 1000)
+    if not block:
+        return 0
+    return -1
+
+
+# Запрос признака Optimized Locking (SQL Server 2023+/Azure SQL):
+# с ним транзакционные app-блокировки агрегируются в один XACT-ресурс
+# на транзакцию вместо отдельных структур на каждый ключ.
+IS_OPTIMIZED_LOCKING_SQL = (
+    b"SELECT CAST(DATABASEPROPERTYEX(DB_NAME(),"
+    b" 'IsOptimizedLockingOn') AS int)"
+)
+
+_OPTIMIZED_LOCKING_CACHE = WeakKeyDictionary()
+
+
+def supports_optimized_locking(connection) -> bool:
+    """Включен ли Optimized Locking в текущей базе.
+
+    Ответ кэшируется по соединению: свойство меняется только
+    администратором, по round-trip на каждый захват не тратится.
+    Там, где он включен, блокировкам выгоден scope=TRANSACTION.
+    """
+    try:
+        supported = _OPTIMIZED_LOCKING_CACHE.get(connection)
+    except TypeError:
+        supported = None
+    if supported is None:
+        with connection.cursor() as cursor:
+            cursor.execute(IS_OPTIMIZED_LOCKING_SQL)
+            row = cursor.fetchone()
+        supported = bool(row and row[0])
+        try:
+            _OPTIMIZED_LOCKING_CACHE[connection] = supported
+        except TypeError:
+            pass
+    return supported
+
+
+def get_lock_mode(lock_type: LockType) -> str:
+    if lock_type == SHARED:
+        return 'Shared'
+    return 'Exclusive'
+
+
+class PyMSSQLAdvisoryLock(Lock):
+
+    __slots__ = (
+        'connection', 'resource', 'resource_key', 'lock_mode', 'timeout',
+        'lock_owner', 'database_principal', 'close_connection', '_cursor',
+        '_acquired',
+    )
+
+    def __init__(
+        self,
+        connection,
+        resource: str,
+        lock_mode: str,
+        timeout: int,
+        lock_owner: str,
+        database_principal: str = 'public',
+        close_connection: bool = False,
+    ):
+        self.connection = connection
+        self.resource = resource
+        self.resource_key = get_resource_key(resource)
+        self.lock_mode = lock_mode
+        self.timeout = timeout
+        self.lock_owner = lock_owner
+        self.database_principal = database_principal
+        self.close_connection = close_connection
+        # Курсор создается лениво и переиспользуется между захватом
+        # и освобождением: pymssql-курсоры дешево держать открытыми.
+        self._cursor = None
+        self._acquired = False
+
+    def _get_cursor(self):
+        if self._cursor is None:
+            self._cursor = self.connection.cursor()
+        return self._cursor
+
+    def __enter__(self):
+        cursor = self._get_cursor()
+        params = (
+            self.database_principal, self.resource_key,
+            self.lock_mode, self.lock_owner, self.timeout,
+        )
+        try:
+            if ensure_getapplock_proc(self.connection, cursor):
+                cursor.callproc(GETAPPLOCK_PROC, params)
+            else:
+                cursor.execute(GETAPPLOCK_SQL, params)
+            result = cursor.fetchone()[0]
+            if result < 0:
+                raise errors.ResourceIsLocked(resource=self.resource)
+        except BaseException:
+            # При неудачном захвате __exit__ не выполняется, поэтому
+            # выделенное соединение возвращается в пул здесь — иначе
+            # несколько занятых ресурсов исчерпали бы lock_pool.
+            if self.close_connection:
+                self._cursor = None
+                self.connection.close()
+            raise
+        self._acquired = True
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            # Если захвата не было, release — лишний round-trip.
+            if self.lock_owner == OWNER_TYPE_TRANSACTION \
+                    or not self._acquired:
+                return
+            self._acquired = False
+            self._get_cursor().execute(
+                RELEASEAPPLOCK_SQL,
+                (
+                    self.database_principal, self.resource_key,
+                    self.lock_owner,
+                ),
+            )
+        finally:
+            if self.close_connection:
+                self._cursor = None
+                self.connection.close()
+
+
+class SQLAlchemyMSAdvisoryLock(Lock):
+
+    __slots__ = (
+        'session', 'resource', 'resource_key', 'lock_mode', 'timeout',
+        'lock_owner', 'database_principal', 'close_session', '_acquired',
+        '_lock_params', '_release_params',
+    )
+
+    def __init__(
+        self,
+        session: Session,
+        resource: str,
+        lock_mode: str,
+        timeout: int,
+        lock_owner: str,
+        database_principal: str = 'public',
+        close_session: bool = False,
+    ):
+        self.session = session
+        self.resource = resource
+        self.resource_key = get_resource_key(resource)
+        self.lock_mode = lock_mode
+        self.timeout = timeout
+        self.lock_owner = lock_owner
+        self.database_principal = database_principal
+        self.close_session = close_session
+        self._acquired = False
+        # Параметры неизменны между захватами этого объекта:
+        # словари собираются один раз, SQLAlchemy копирует их сам.
+        self._lock_params = {
+            'principal': database_principal,
+            'resource': self.resource_key,
+            'mode': lock_mode,
+            'owner': lock_owner,
+            'timeout': timeout,
+        }
+        self._release_params = {
+            'principal': database_principal,
+            'resource': self.resource_key,
+            'owner': lock_owner,
+        }
+
+    def __enter__(self):
+        try:
+            # Запрос идет через Core-соединение: без autoflush,
+            # unit-of-work и событий сессии.
+            result = self.session.connection().execute(
+                GETAPPLOCK_TEXT, self._lock_params,
+            ).scalar()
+            if result < 0:
+                raise errors.ResourceIsLocked(resource=self.resource)
+        except BaseException:
+            # При неудачном захвате __exit__ не выполняется, поэтому
+            # сессия с соединением из lock_engine закрывается здесь.
+            if self.close_session:
+                self.session.close()
+            raise
+        self._acquired = True
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            # Если захвата не было, release — лишний round-trip.
+            if self.lock_owner == OWNER_TYPE_TRANSACTION \
+                    or not self._acquired:
+                return
+            self._acquired = False
+            self.session.connection().execute(
+                RELEASEAPPLOCK_TEXT, self._release_params,
+            )
+        finally:
+            if self.close_session:
+                self.session.close()
+
+
+class AcquirePyMSSQLAdvisoryLock(AcquireLock):
+
+    __slots__ = (
+        'connection', 'block', 'timeout', 'lock_type', 'scope', 'lock_mode',
+        'database_principal', 'lock_pool', '_default_mode', '_default_owner',
+        '_default_timeout',
+    )
+
+    def __init__(
+        self,
+        connection=None,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+        lock_mode: Optional[str] = None,
+        database_principal: str = 'public',
+        lock_pool: Optional[Callable[[], Any]] = None,
+    ):
+        # lock_pool выделяет отдельное соединение под блокировки,
+        # чтобы ожидание в sp_getapplock не занимало соединение
+        # из общего пула приложения. Соединение возвращается
+        # в пул через close() при освобождении блокировки.
+        assert connection is not None or lock_pool is not None
+        self.connection = connection
+        self.block = block
+        self.timeout = timeout
+        self.lock_type = lock_type
+        self.scope = scope
+        self.lock_mode = lock_mode
+        self.database_principal = database_principal
+        self.lock_pool = lock_pool
+        # Производные значения по умолчанию считаются один раз:
+        # в __call__ они пересчитываются только при явном переопределении.
+        self._default_mode = lock_mode or get_lock_mode(lock_type)
+        self._default_owner = SCOPE_TO_OWNER[scope]
+        self._default_timeout = handle_timeout(timeout, block)
+
+    def __call__(
+        self,
+        resource: str,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> PyMSSQLAdvisoryLock:
+        if lock_type is None:
+            lock_mode = self._default_mode
+        else:
+            lock_mode = self.lock_mode or get_lock_mode(lock_type)
+        if scope is None:
+            lock_owner = self._default_owner
+        else:
+            lock_owner = SCOPE_TO_OWNER[scope]
+        if block is None and timeout is None:
+            lock_timeout = self._default_timeout
+        else:
+            lock_timeout = handle_timeout(
+                timeout if timeout is not None else self.timeout,
+                block if block is not None else self.block,
+            )
+        if self.lock_pool is not None:
+            connection = self.lock_pool()
+        else:
+            connection = self.connection
+        return PyMSSQLAdvisoryLock(
+            connection, resource, lock_mode, lock_timeout,
+            lock_owner, self.database_principal,
+            close_connection=self.lock_pool is not None,
+        )
+
+
+class AcquireSQLAlchemyMSAdvisoryLock(AcquireLock):
+
+    __slots__ = (
+        'session', 'block', 'timeout', 'lock_type', 'scope', 'lock_mode',
+        'database_principal', 'lock_engine', '_default_mode',
+        '_default_owner', '_default_timeout',
+    )
+
+    def __init__(
+        self,
+        session: Optional[Session] = None,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+        lock_mode: Optional[str] = None,
+        database_principal: str = 'public',
+        lock_engine: Optional[Engine] = None,
+    ):
+        # lock_engine с небольшим отдельным пулом (например QueuePool
+        # с pool_size=4, max_overflow=0) не дает ожиданию блокировки
+        # занимать транзакционное соединение вызывающего кода.
+        assert session is not None or lock_engine is not None
+        self.session = session
+        self.block = block
+        self.timeout = timeout
+        self.lock_type = lock_type
+        self.scope = scope
+        self.lock_mode = lock_mode
+        self.database_principal = database_principal
+        self.lock_engine = lock_engine
+        self._default_mode = lock_mode or get_lock_mode(lock_type)
+        self._default_owner = SCOPE_TO_OWNER[scope]
+        self._default_timeout = handle_timeout(timeout, block)
+
+    def __call__(
+        self,
+        resource: str,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> SQLAlchemyMSAdvisoryLock:
+        if lock_type is None:
+            lock_mode = self._default_mode
+        else:
+            lock_mode = self.lock_mode or get_lock_mode(lock_type)
+        if scope is None:
+            lock_owner = self._default_owner
+        else:
+            lock_owner = SCOPE_TO_OWNER[scope]
+        if block is None and timeout is None:
+            lock_timeout = self._default_timeout
+        else:
+            lock_timeout = handle_timeout(
+                timeout if timeout is not None else self.timeout,
+                block if block is not None else self.block,
+            )
+        if self.lock_engine is not None:
+            session = Session(self.lock_engine)
+        else:
+            session = self.session
+        return SQLAlchemyMSAdvisoryLock(
+            session, resource, lock_mode, lock_timeout,
+            lock_owner, self.database_principal,
+            close_session=self.lock_engine is not None,
+        )
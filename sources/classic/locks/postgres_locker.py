@@ -0,0 +1,1127 @@
+import random
+import struct
+import time
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Optional
+from weakref import WeakKeyDictionary, WeakValueDictionary
+
+from sqlalchemy import BigInteger, bindparam, event, func, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from . import errors
+from .lock import (
+    EXCLUSIVE, SESSION, SHARED, TRANSACTION,
+    AcquireLock, Lock, LockType, ScopeType,
+)
+
+
+WAIT_QUERY = 'wait'
+TRY_QUERY = 'try'
+
+LOCK_FN_QUERY_TYPE_MAP = {
+    'pg_advisory_lock': WAIT_QUERY,
+    'pg_advisory_lock_shared': WAIT_QUERY,
+    'pg_advisory_xact_lock': WAIT_QUERY,
+    'pg_advisory_xact_lock_shared': WAIT_QUERY,
+    'pg_try_advisory_lock': TRY_QUERY,
+    'pg_try_advisory_lock_shared': TRY_QUERY,
+    'pg_try_advisory_xact_lock': TRY_QUERY,
+    'pg_try_advisory_xact_lock_shared': TRY_QUERY,
+}
+
+
+# Готовые select-выражения по имени функции PostgreSQL: дерево
+# выражения и его компиляция разделяются всеми блокировками процесса
+# вместо построения заново на каждую итерацию цикла захвата.
+_STMT_CACHE = {}
+
+
+def get_select_stmt(fn_name: str):
+    stmt = _STMT_CACHE.get(fn_name)
+    if stmt is None:
+        # Явный BigInteger избавляет компилятор от вывода типа
+        # параметра на каждом выполнении.
+        stmt = select(
+            getattr(func, fn_name)(bindparam('id', type_=BigInteger)),
+        )
+        _STMT_CACHE[fn_name] = stmt
+    return stmt
+
+
+# Опциональные C-хэши. Advisory-блокировки кооперативны, криптостойкость
+# id не нужна — достаточно, чтобы все процессы, делящие одни блокировки,
+# считали его одинаково, поэтому fasthash ставится во всех сервисах сразу.
+# Фиксированный C-декодер для 8 байт little-endian signed:
+# быстрее универсального int.from_bytes.
+_INT8_LE = struct.Struct('<q').unpack
+
+try:
+    from xxhash import xxh64_intdigest as _xxh64_intdigest
+except ImportError:
+    _xxh64_intdigest = None
+
+try:
+    from mmh3 import hash64 as _mmh3_hash64
+except ImportError:
+    _mmh3_hash64 = None
+
+
+# Имена ресурсов в приложении — небольшое фиксированное множество,
+# поэтому id считается один раз и дальше берется из кэша. Размер
+# ограничен, чтобы динамические имена не раздували память процесса.
+@lru_cache(maxsize=4096)
+def get_resource_id(resource: str, use_crypto_hash: bool = False) -> int:
+    """Отображает имя ресурса в bigint для advisory-функций.
+
+    use_crypto_hash=True принудительно включает BLAKE2b — для случаев,
+    когда id должен совпадать с вычисленным на другом языке.
+    """
+    if not use_crypto_hash:
+        if _xxh64_intdigest is not None:
+            value = _xxh64_intdigest(resource.encode('utf-8'), seed=0)
+            return value - (1 << 64) if value >= (1 << 63) else value
+        if _mmh3_hash64 is not None:
+            return _mmh3_hash64(resource.encode('utf-8'))[0]
+    # digest_size=8: BLAKE2b отдает ровно нужные 8 байт, без
+    # вычисления и отбрасывания остальных 56.
+    digest = blake2b(resource.encode('utf-8'), digest_size=8).digest()
+    return _INT8_LE(digest)[0]
+
+
+def _build_lock_fn(
+    block: bool,
+    lock_type: LockType,
+    scope: ScopeType,
+) -> str:
+    lock_fn = 'pg_'
+    if not block:
+        lock_fn += 'try_'
+    lock_fn += 'advisory_'
+    if scope == TRANSACTION:
+        lock_fn += 'xact_'
+    lock_fn += 'lock'
+    if lock_type == SHARED:
+        lock_fn += '_shared'
+    return lock_fn
+
+
+def get_try_lock_fn(lock_fn: str) -> str:
+    """Неблокирующий вариант функции блокировки.
+
+    Ожидание выполняется циклом на клиенте: процесс не виснет внутри
+    бэкенда PostgreSQL и соединение не занято ожиданием.
+    """
+    if lock_fn.startswith('pg_try_'):
+        return lock_fn
+    return 'pg_try_' + lock_fn[len('pg_'):]
+
+
+def get_unlock_fn(lock_fn: str) -> Optional[str]:
+    if 'xact' in lock_fn:
+        return None
+    if lock_fn.endswith('_shared'):
+        return 'pg_advisory_unlock_shared'
+    return 'pg_advisory_unlock'
+
+
+# Все 8 комбинаций параметров и производные имена функций считаются
+# один раз при импорте — на захвате остаются только словарные выборки.
+LOCK_FN_TABLE = {
+    (block, lock_type, scope): _build_lock_fn(block, lock_type, scope)
+    for block in (True, False)
+    for lock_type in (EXCLUSIVE, SHARED)
+    for scope in (TRANSACTION, SESSION)
+}
+
+TRY_LOCK_FN_MAP = {
+    lock_fn: get_try_lock_fn(lock_fn)
+    for lock_fn in LOCK_FN_TABLE.values()
+}
+
+UNLOCK_FN_MAP = {
+    lock_fn: get_unlock_fn(lock_fn)
+    for lock_fn in LOCK_FN_TABLE.values()
+}
+
+
+# Тексты запросов для psycopg-классов, по одному на функцию.
+# Хранятся как bytes: перекодировка str -> utf-8 на каждый вызов не нужна.
+SELECT_SQL = {
+    fn: 'SELECT {}(%s)'.format(fn).encode()
+    for fn in {
+        *LOCK_FN_TABLE.values(),
+        *TRY_LOCK_FN_MAP.values(),
+        *(fn for fn in UNLOCK_FN_MAP.values() if fn),
+    }
+}
+
+
+# Серверные подготовленные операторы для psycopg2: PREPARE выполняется
+# один раз на соединение, в цикле ожидания остается EXECUTE без
+# повторного parse/plan на сервере.
+PREPARE_SQL = {
+    fn: 'PREPARE cl_{0} (bigint) AS SELECT {0}($1)'.format(fn).encode()
+    for fn in SELECT_SQL
+}
+EXECUTE_SQL = {
+    fn: 'EXECUTE cl_{}(%s)'.format(fn).encode()
+    for fn in SELECT_SQL
+}
+
+_PREPARED_FNS = WeakKeyDictionary()
+
+
+def prepared_sql(connection, cursor, fn_name: str) -> bytes:
+    """EXECUTE заранее подготовленного оператора для fn_name.
+
+    Для соединений без поддержки weakref возвращает обычный SELECT:
+    подготовка без кэша дала бы повторный PREPARE и ошибку имени.
+    """
+    try:
+        prepared = _PREPARED_FNS.get(connection)
+    except TypeError:
+        return SELECT_SQL[fn_name]
+    if prepared is None:
+        prepared = set()
+        _PREPARED_FNS[connection] = prepared
+    if fn_name not in prepared:
+        cursor.execute(PREPARE_SQL[fn_name])
+        prepared.add(fn_name)
+    return EXECUTE_SQL[fn_name]
+
+
+# Те же запросы в виде str — для exec_driver_sql, который
+# не перекодирует и не компилирует ничего на стороне SQLAlchemy.
+SELECT_TEXT = {
+    fn: 'SELECT {}(%s)'.format(fn)
+    for fn in SELECT_SQL
+}
+
+
+def get_lock_fn(
+    block: bool,
+    lock_type: LockType,
+    scope: ScopeType,
+) -> str:
+    return LOCK_FN_TABLE[block, lock_type, scope]
+
+
+# SQLSTATE 55P03: lock_not_available — истек lock_timeout на сервере.
+LOCK_NOT_AVAILABLE = '55P03'
+
+SAVEPOINT_SQL = b'SAVEPOINT classic_locks'
+ROLLBACK_SAVEPOINT_SQL = b'ROLLBACK TO SAVEPOINT classic_locks'
+RELEASE_SAVEPOINT_SQL = b'RELEASE SAVEPOINT classic_locks'
+# set_config вместо SET LOCAL: принимает значение параметром
+# и одинаково работает в psycopg2 и psycopg3.
+SET_LOCK_TIMEOUT_SQL = b"SELECT set_config('lock_timeout', %s, true)"
+
+# SAVEPOINT, стэш текущего lock_timeout в кастомный GUC и установка
+# нового — одной командой, минус round-trip на захват. Без параметров
+# обе библиотеки выполняют несколько операторов разом (psycopg3 —
+# только текстовым курсором, см. _execute_batch); значение таймаута
+# получено из int и подстановкой не является.
+_LOCK_TIMEOUT_PREAMBLE_CACHE = {}
+
+
+def _lock_timeout_preamble(timeout_ms: str) -> bytes:
+    sql = _LOCK_TIMEOUT_PREAMBLE_CACHE.get(timeout_ms)
+    if sql is None:
+        sql = (
+            SAVEPOINT_SQL
+            + b"; SELECT set_config('classic_locks.lock_timeout',"
+            b" current_setting('lock_timeout'), true)"
+            + "; SELECT set_config('lock_timeout', '{}', true)"
+            .format(timeout_ms).encode()
+        )
+        _LOCK_TIMEOUT_PREAMBLE_CACHE[timeout_ms] = sql
+    return sql
+
+
+# RELEASE SAVEPOINT не откатывает GUC (их возвращает только откат
+# точки сохранения), поэтому на успешном захвате прежний lock_timeout
+# восстанавливается явно из стэша — иначе он действовал бы на все
+# обычные блокировки до конца транзакции вызывающего.
+RESTORE_LOCK_TIMEOUT_SQL = (
+    b"SELECT set_config('lock_timeout',"
+    b" current_setting('classic_locks.lock_timeout'), true); "
+    + RELEASE_SAVEPOINT_SQL
+)
+
+
+SET_LOCK_TIMEOUT_TEXT = text(
+    "SELECT set_config('lock_timeout', :timeout, true)"
+)
+
+CURRENT_LOCK_TIMEOUT_TEXT = text("SELECT current_setting('lock_timeout')")
+
+
+# Метка на DBAPI-соединении: блокировка действительно бралась.
+TAINTED_KEY = 'classic_locks_tainted'
+
+UNLOCK_ALL_SQL = 'SELECT pg_advisory_unlock_all()'
+
+
+def register_pool_listener(engine) -> None:
+    """Сброс advisory-блокировок при возврате соединения в пул.
+
+    pg_advisory_unlock_all выполняется только для соединений,
+    помеченных захватом (taint_connections=True у фабрики) — чистые
+    соединения возвращаются в пул без лишнего round-trip.
+    """
+
+    @event.listens_for(engine, 'checkin')
+    def _unlock_tainted(dbapi_connection, connection_record):
+        if connection_record.info.pop(TAINTED_KEY, None):
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute(UNLOCK_ALL_SQL)
+            finally:
+                cursor.close()
+
+
+def is_lock_not_available(exc: BaseException) -> bool:
+    code = (
+        getattr(exc, 'pgcode', None)
+        or getattr(exc, 'sqlstate', None)
+    )
+    if code is None:
+        orig = getattr(exc, 'orig', None)
+        if orig is not None:
+            code = (
+                getattr(orig, 'pgcode', None)
+                or getattr(orig, 'sqlstate', None)
+            )
+    return code == LOCK_NOT_AVAILABLE
+
+
+# Тексты батч-запросов по (функция, размер набора).
+_MULTI_SQL_CACHE = {}
+
+
+def _multi_sql(fn_name: str, count: int) -> bytes:
+    key = (fn_name, count)
+    sql = _MULTI_SQL_CACHE.get(key)
+    if sql is None:
+        sql = (
+            'SELECT ' + ', '.join([fn_name + '(%s)'] * count)
+        ).encode()
+        _MULTI_SQL_CACHE[key] = sql
+    return sql
+
+
+class _PsycopgPGAdvisoryLock(Lock):
+    """Общая логика захвата для psycopg2 и psycopg3.
+
+    Подклассы определяют только выполнение запроса в цикле опроса —
+    остальные оптимизации (серверное ожидание, lock_timeout, backoff,
+    один курсор на захват) живут здесь в единственном экземпляре.
+    """
+
+    __slots__ = (
+        'connection', 'resource', 'resource_id', 'lock_fn', 'try_lock_fn',
+        'unlock_fn', 'is_wait_query', 'timeout', 'delay', 'initial_delay',
+        '_lock_sql', '_wait_sql', '_unlock_sql', '_acquired', 'cursor',
+        '_reentries', '__weakref__',
+    )
+
+    def __init__(
+        self,
+        connection,
+        resource: str,
+        lock_fn: str,
+        timeout: Optional[int] = None,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+        resource_id: Optional[int] = None,
+    ):
+        self.connection = connection
+        self.resource = resource
+        self.resource_id = (
+            resource_id if resource_id is not None
+            else get_resource_id(resource)
+        )
+        self.lock_fn = lock_fn
+        self.try_lock_fn = TRY_LOCK_FN_MAP[lock_fn]
+        self.unlock_fn = UNLOCK_FN_MAP[lock_fn]
+        self.is_wait_query = (
+            LOCK_FN_QUERY_TYPE_MAP[lock_fn] == WAIT_QUERY
+        )
+        self.timeout = timeout
+        self.delay = delay
+        self.initial_delay = initial_delay
+        self._lock_sql = SELECT_SQL[self.try_lock_fn]
+        self._wait_sql = SELECT_SQL[lock_fn]
+        self._unlock_sql = (
+            SELECT_SQL[self.unlock_fn] if self.unlock_fn else None
+        )
+        self._acquired = False
+        self._reentries = 0
+        self.cursor = None
+
+    def _make_cursor(self):
+        return self.connection.cursor()
+
+    def _poll_lock_sql(self, cursor) -> bytes:
+        return self._lock_sql
+
+    def _execute_poll(self, cursor, lock_sql):
+        cursor.execute(lock_sql, (self.resource_id,))
+
+    def _execute_batch(self, cursor, sql):
+        # Многооператорные батчи SAVEPOINT/set_config; подклассы
+        # могут направить их через другой курсор.
+        cursor.execute(sql)
+
+    def __enter__(self):
+        # Session-блокировки на сервере рекурсивны для своей сессии,
+        # поэтому повторный вход по уже удержанному ресурсу
+        # обслуживается локальным счетчиком — без round-trip.
+        # Для xact-блокировок счетчика нет: их снимает конец транзакции.
+        if self.unlock_fn and self._acquired:
+            self._reentries += 1
+            return self
+        block = self.is_wait_query
+        # Один курсор на весь захват: он живет до __exit__,
+        # и unlock выполняется им же без новой аллокации.
+        cursor = self.cursor = self._make_cursor()
+        try:
+            if block and self.timeout is None:
+                # Без таймаута цикл не нужен: сервер сам будит бэкенд
+                # в момент освобождения — ровно один round-trip.
+                # Поэтому же здесь нет LISTEN/NOTIFY: очередь ожидания
+                # блокировки внутри сервера будит ожидающих без
+                # отдельного канала и обязательств на стороне держателя.
+                cursor.execute(self._wait_sql, (self.resource_id,))
+                self._acquired = True
+                return self
+            if block and not getattr(self.connection, 'autocommit', False):
+                self._acquire_with_lock_timeout(cursor)
+                return self
+            deadline_ns = (
+                time.monotonic_ns() + int(self.timeout * 1_000_000_000)
+                if self.timeout is not None else None
+            )
+            lock_sql = self._poll_lock_sql(cursor)
+            delay = self.initial_delay
+            while True:
+                self._execute_poll(cursor, lock_sql)
+                if cursor.fetchone()[0]:
+                    self._acquired = True
+                    return self
+                if deadline_ns is not None:
+                    remaining_ns = deadline_ns - time.monotonic_ns()
+                    if remaining_ns <= 0:
+                        raise errors.ResourceIsLocked(
+                            resource=self.resource,
+                        )
+                    # Пауза не выходит за остаток бюджета времени.
+                    time.sleep(min(
+                        delay + random.uniform(0, delay),
+                        remaining_ns * 1e-9,
+                    ))
+                elif not block:
+                    raise errors.ResourceIsLocked(resource=self.resource)
+                else:
+                    time.sleep(delay + random.uniform(0, delay))
+                delay = min(delay * 2, self.delay)
+        except BaseException:
+            self.cursor = None
+            cursor.close()
+            raise
+
+    def _acquire_with_lock_timeout(self, cursor):
+        # Таймаут ожидания контролирует сервер через lock_timeout:
+        # ожидание не тратит round-trip на каждую попытку. SAVEPOINT
+        # откатывает неудачный захват, не трогая транзакцию вызывающего.
+        timeout_ms = '{}ms'.format(int(self.timeout * 1000))
+        try:
+            self._execute_batch(cursor, _lock_timeout_preamble(timeout_ms))
+            cursor.execute(self._wait_sql, (self.resource_id,))
+        except Exception as exc:
+            if not is_lock_not_available(exc):
+                raise
+            cursor.execute(ROLLBACK_SAVEPOINT_SQL)
+            raise errors.ResourceIsLocked(resource=self.resource)
+        self._execute_batch(cursor, RESTORE_LOCK_TIMEOUT_SQL)
+        self._acquired = True
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._reentries:
+            self._reentries -= 1
+            return
+        cursor, self.cursor = self.cursor, None
+        try:
+            # Если захвата не было, незачем тратить round-trip на unlock.
+            if self.unlock_fn and self._acquired:
+                self._acquired = False
+                cursor.execute(self._unlock_sql, (self.resource_id,))
+        finally:
+            cursor.close()
+
+
+class Psycopg2PGAdvisoryLock(_PsycopgPGAdvisoryLock):
+
+    __slots__ = ()
+
+    def _poll_lock_sql(self, cursor) -> bytes:
+        # PREPARE транзакционен: откат уничтожил бы оператор,
+        # а кэш остался бы, поэтому готовим только в autocommit —
+        # именно там цикл опроса и крутится.
+        if getattr(self.connection, 'autocommit', False):
+            return prepared_sql(self.connection, cursor, self.try_lock_fn)
+        return self._lock_sql
+
+
+class Psycopg3PGAdvisoryLock(_PsycopgPGAdvisoryLock):
+
+    __slots__ = ()
+
+    def _make_cursor(self):
+        # Бинарный протокол: bool приходит одним байтом,
+        # без текстового представления и его разбора.
+        return self.connection.cursor(binary=True)
+
+    def _execute_poll(self, cursor, lock_sql):
+        # psycopg3 сам ведет кэш подготовленных операторов.
+        cursor.execute(lock_sql, (self.resource_id,), prepare=True)
+
+    def _execute_batch(self, cursor, sql):
+        # Бинарный формат результата вынуждает psycopg3 работать
+        # расширенным протоколом, который не принимает несколько
+        # операторов одной командой. Батчи идут через временный
+        # текстовый курсор: без параметров он остается на простом
+        # протоколе.
+        with self.connection.cursor() as batch_cursor:
+            batch_cursor.execute(sql)
+
+    def pipelined(self, do):
+        """Захват, работа и освобождение одним конвейером psycopg3.
+
+        В pipeline-режиме запросы короткой критической секции уходят
+        на сервер без ожидания ответа на каждый: вместо трех
+        round-trip (lock, работа, unlock) — один сетевой sync.
+        """
+        with self.connection.pipeline():
+            with self:
+                return do(self.connection)
+
+
+class SQLAlchemyPGAdvisoryLock(Lock):
+
+    __slots__ = (
+        'session', 'resource', 'resource_id', 'lock_fn', 'try_lock_fn',
+        'unlock_fn', 'is_wait_query', 'timeout', 'delay', 'initial_delay',
+        'taint', '_lock_stmt', '_wait_stmt', '_unlock_stmt', '_lock_text',
+        '_acquired', '_reentries', '__weakref__',
+    )
+
+    def __init__(
+        self,
+        session: Session,
+        resource: str,
+        lock_fn: str,
+        timeout: Optional[int] = None,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+        taint: bool = False,
+        resource_id: Optional[int] = None,
+    ):
+        self.session = session
+        self.resource = resource
+        self.resource_id = (
+            resource_id if resource_id is not None
+            else get_resource_id(resource)
+        )
+        self.lock_fn = lock_fn
+        self.try_lock_fn = TRY_LOCK_FN_MAP[lock_fn]
+        self.unlock_fn = UNLOCK_FN_MAP[lock_fn]
+        self.is_wait_query = (
+            LOCK_FN_QUERY_TYPE_MAP[lock_fn] == WAIT_QUERY
+        )
+        self.timeout = timeout
+        self.delay = delay
+        self.initial_delay = initial_delay
+        self.taint = taint
+        # Выражения разрешаются один раз: итерации цикла захвата
+        # не трогают func и кэш выражений вовсе.
+        self._lock_stmt = get_select_stmt(self.try_lock_fn)
+        self._wait_stmt = get_select_stmt(lock_fn)
+        self._unlock_stmt = (
+            get_select_stmt(self.unlock_fn) if self.unlock_fn else None
+        )
+        self._lock_text = SELECT_TEXT[self.try_lock_fn]
+        self._acquired = False
+        self._reentries = 0
+
+    def __enter__(self):
+        # Повторный вход по удержанному ресурсу — см. комментарий
+        # в _PsycopgPGAdvisoryLock.__enter__.
+        if self.unlock_fn and self._acquired:
+            self._reentries += 1
+            return self
+        block = self.is_wait_query
+        params = {'id': self.resource_id}
+        # Запросы идут через Core-соединение: без autoflush,
+        # unit-of-work и событий сессии на каждую попытку.
+        connection = self.session.connection()
+        if block and self.timeout is None:
+            # Без таймаута цикл не нужен: сервер сам будит бэкенд
+            # в момент освобождения — ровно один round-trip.
+            connection.execute(self._wait_stmt, params)
+            self.__mark_acquired(connection)
+            return self
+        if block:
+            # Таймаут ожидания контролирует сервер через lock_timeout;
+            # begin_nested откатывает неудачный захват по SAVEPOINT.
+            timeout_ms = '{}ms'.format(int(self.timeout * 1000))
+            try:
+                with self.session.begin_nested():
+                    saved_timeout = connection.execute(
+                        CURRENT_LOCK_TIMEOUT_TEXT,
+                    ).scalar()
+                    connection.execute(
+                        SET_LOCK_TIMEOUT_TEXT, {'timeout': timeout_ms},
+                    )
+                    connection.execute(self._wait_stmt, params)
+            except DBAPIError as exc:
+                if not is_lock_not_available(exc):
+                    raise
+                raise errors.ResourceIsLocked(resource=self.resource)
+            # RELEASE SAVEPOINT не откатывает GUC: прежний lock_timeout
+            # возвращается явно, иначе он действовал бы на все обычные
+            # блокировки до конца транзакции вызывающего.
+            connection.execute(
+                SET_LOCK_TIMEOUT_TEXT, {'timeout': saved_timeout},
+            )
+            self.__mark_acquired(connection)
+            return self
+        deadline_ns = (
+            time.monotonic_ns() + int(self.timeout * 1_000_000_000)
+            if self.timeout is not None else None
+        )
+        delay = self.initial_delay
+        while True:
+            # В цикле запрос уходит напрямую драйверу: без компиляции
+            # Core и обвязки Result на каждую попытку. Диалект здесь
+            # всегда psycopg-семейства, плейсхолдер %s безопасен.
+            is_access = connection.exec_driver_sql(
+                self._lock_text, (self.resource_id,),
+            ).scalar()
+            if is_access:
+                self.__mark_acquired(connection)
+                return self
+            if deadline_ns is not None:
+                remaining_ns = deadline_ns - time.monotonic_ns()
+                if remaining_ns <= 0:
+                    raise errors.ResourceIsLocked(resource=self.resource)
+                # Пауза не выходит за остаток бюджета времени.
+                time.sleep(min(
+                    delay + random.uniform(0, delay),
+                    remaining_ns * 1e-9,
+                ))
+            elif not block:
+                raise errors.ResourceIsLocked(resource=self.resource)
+            else:
+                time.sleep(delay + random.uniform(0, delay))
+            delay = min(delay * 2, self.delay)
+
+    def __mark_acquired(self, connection):
+        self._acquired = True
+        if self.taint:
+            connection.connection.info[TAINTED_KEY] = True
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._reentries:
+            self._reentries -= 1
+            return
+        # Если захвата не было, незачем тратить round-trip на unlock.
+        if self.unlock_fn and self._acquired:
+            self._acquired = False
+            self.session.connection().execute(
+                self._unlock_stmt, {'id': self.resource_id},
+            ).scalar()
+
+
+class PGAdvisoryMultiLock(Lock):
+    """Захват набора ресурсов одним запросом к PostgreSQL.
+
+    Вместо round-trip на каждый ресурс весь набор забирается одним
+    SELECT. Идентификаторы сортируются, чтобы все клиенты захватывали
+    ресурсы в одном порядке и не создавали дедлоков.
+    """
+
+    __slots__ = (
+        'connection', 'resources', 'resource_ids', 'lock_fn', 'try_lock_fn',
+        'unlock_fn', 'is_wait_query', 'timeout', 'delay', 'initial_delay',
+        '_wait_sql', '_try_sql', '_unlock_sql',
+    )
+
+    def __init__(
+        self,
+        connection,
+        resources,
+        lock_fn: str,
+        timeout: Optional[int] = None,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+    ):
+        self.connection = connection
+        self.resources = tuple(resources)
+        # set убирает дубли: повторный ресурс в наборе не тратит
+        # лишний вызов функции блокировки и освобождения.
+        self.resource_ids = sorted({
+            get_resource_id(resource) for resource in self.resources
+        })
+        self.lock_fn = lock_fn
+        self.try_lock_fn = TRY_LOCK_FN_MAP[lock_fn]
+        self.unlock_fn = UNLOCK_FN_MAP[lock_fn]
+        self.is_wait_query = (
+            LOCK_FN_QUERY_TYPE_MAP[lock_fn] == WAIT_QUERY
+        )
+        self.timeout = timeout
+        self.delay = delay
+        self.initial_delay = initial_delay
+        count = len(self.resource_ids)
+        self._wait_sql = _multi_sql(lock_fn, count)
+        self._try_sql = _multi_sql(self.try_lock_fn, count)
+        self._unlock_sql = (
+            _multi_sql(self.unlock_fn, count) if self.unlock_fn else None
+        )
+
+    def __enter__(self):
+        block = self.is_wait_query
+        cursor = self.connection.cursor()
+        try:
+            if block and self.timeout is None:
+                # Без таймаута выгоднее ждать на сервере:
+                # ровно один round-trip на весь набор.
+                cursor.execute(self._wait_sql, self.resource_ids)
+                return self
+            deadline_ns = (
+                time.monotonic_ns() + int(self.timeout * 1_000_000_000)
+                if self.timeout is not None else None
+            )
+            delay = self.initial_delay
+            while True:
+                cursor.execute(self._try_sql, self.resource_ids)
+                row = cursor.fetchone()
+                if all(row):
+                    return self
+                self.__release_partial(cursor, row)
+                if deadline_ns is not None:
+                    remaining_ns = deadline_ns - time.monotonic_ns()
+                    if remaining_ns <= 0:
+                        raise errors.ResourceIsLocked(
+                            resource=', '.join(self.resources),
+                        )
+                    time.sleep(min(
+                        delay + random.uniform(0, delay),
+                        remaining_ns * 1e-9,
+                    ))
+                elif not block:
+                    raise errors.ResourceIsLocked(
+                        resource=', '.join(self.resources),
+                    )
+                else:
+                    time.sleep(delay + random.uniform(0, delay))
+                delay = min(delay * 2, self.delay)
+        finally:
+            cursor.close()
+
+    def __release_partial(self, cursor, row):
+        # Частично захваченные ресурсы освобождаются до паузы, иначе
+        # клиенты, держащие разные половины набора, встанут навсегда.
+        # Для xact-блокировок освобождает сама транзакция.
+        if not self.unlock_fn:
+            return
+        acquired = [
+            resource_id
+            for resource_id, is_access in zip(self.resource_ids, row)
+            if is_access
+        ]
+        if acquired:
+            cursor.execute(
+                _multi_sql(self.unlock_fn, len(acquired)), acquired,
+            )
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._unlock_sql:
+            with self.connection.cursor() as cursor:
+                cursor.execute(self._unlock_sql, self.resource_ids)
+
+
+_MULTI_TEXT_CACHE = {}
+
+
+def _multi_text(fn_name: str, count: int):
+    key = (fn_name, count)
+    stmt = _MULTI_TEXT_CACHE.get(key)
+    if stmt is None:
+        stmt = text(
+            'SELECT ' + ', '.join(
+                '{}(:id{})'.format(fn_name, n) for n in range(count)
+            )
+        )
+        _MULTI_TEXT_CACHE[key] = stmt
+    return stmt
+
+
+
+class SQLAlchemyPGAdvisoryMultiLock(Lock):
+    """То же, что PGAdvisoryMultiLock, но поверх сессии SQLAlchemy."""
+
+    __slots__ = (
+        'session', 'resources', 'resource_ids', 'lock_fn', 'try_lock_fn',
+        'unlock_fn', 'is_wait_query', 'timeout', 'delay', 'initial_delay',
+        '_params', '_wait_stmt', '_try_stmt', '_unlock_stmt',
+    )
+
+    def __init__(
+        self,
+        session: Session,
+        resources,
+        lock_fn: str,
+        timeout: Optional[int] = None,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+    ):
+        self.session = session
+        self.resources = tuple(resources)
+        # set убирает дубли: повторный ресурс в наборе не тратит
+        # лишний вызов функции блокировки и освобождения.
+        self.resource_ids = sorted({
+            get_resource_id(resource) for resource in self.resources
+        })
+        self.lock_fn = lock_fn
+        self.try_lock_fn = TRY_LOCK_FN_MAP[lock_fn]
+        self.unlock_fn = UNLOCK_FN_MAP[lock_fn]
+        self.is_wait_query = (
+            LOCK_FN_QUERY_TYPE_MAP[lock_fn] == WAIT_QUERY
+        )
+        self.timeout = timeout
+        self.delay = delay
+        self.initial_delay = initial_delay
+        count = len(self.resource_ids)
+        self._params = {
+            'id{}'.format(n): resource_id
+            for n, resource_id in enumerate(self.resource_ids)
+        }
+        self._wait_stmt = _multi_text(lock_fn, count)
+        self._try_stmt = _multi_text(self.try_lock_fn, count)
+        self._unlock_stmt = (
+            _multi_text(self.unlock_fn, count) if self.unlock_fn else None
+        )
+
+    def __enter__(self):
+        block = self.is_wait_query
+        connection = self.session.connection()
+        if block and self.timeout is None:
+            connection.execute(self._wait_stmt, self._params)
+            return self
+        deadline_ns = (
+            time.monotonic_ns() + int(self.timeout * 1_000_000_000)
+            if self.timeout is not None else None
+        )
+        delay = self.initial_delay
+        while True:
+            row = connection.execute(
+                self._try_stmt, self._params,
+            ).one()
+            if all(row):
+                return self
+            self.__release_partial(row)
+            if deadline_ns is not None:
+                remaining_ns = deadline_ns - time.monotonic_ns()
+                if remaining_ns <= 0:
+                    raise errors.ResourceIsLocked(
+                        resource=', '.join(self.resources),
+                    )
+                time.sleep(min(
+                    delay + random.uniform(0, delay),
+                    remaining_ns * 1e-9,
+                ))
+            elif not block:
+                raise errors.ResourceIsLocked(
+                    resource=', '.join(self.resources),
+                )
+            else:
+                time.sleep(delay + random.uniform(0, delay))
+            delay = min(delay * 2, self.delay)
+
+    def __release_partial(self, row):
+        if not self.unlock_fn:
+            return
+        acquired = [
+            resource_id
+            for resource_id, is_access in zip(self.resource_ids, row)
+            if is_access
+        ]
+        if acquired:
+            self.session.connection().execute(
+                _multi_text(self.unlock_fn, len(acquired)),
+                {
+                    'id{}'.format(n): resource_id
+                    for n, resource_id in enumerate(acquired)
+                },
+            )
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._unlock_stmt is not None:
+            self.session.connection().execute(
+                self._unlock_stmt, self._params,
+            )
+
+
+class AcquirePsycopg2PGAdvisoryLock(AcquireLock):
+
+    __slots__ = (
+        'connection', 'block', 'timeout', 'lock_type', 'scope',
+        '_default_lock_fn', 'delay', 'initial_delay', '_cache',
+    )
+
+    def __init__(
+        self,
+        connection,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+    ):
+        self.connection = connection
+        self.block = block
+        self.timeout = timeout
+        self.lock_type = lock_type
+        self.scope = scope
+        # Частый случай — вызов без переопределений:
+        # имя функции для умолчаний считается один раз здесь.
+        self._default_lock_fn = get_lock_fn(block, lock_type, scope)
+        self.delay = delay
+        self.initial_delay = initial_delay
+        # Flyweight: объекты блокировок неизменяемы между захватами,
+        # повторный acquire того же ресурса переиспользует готовый.
+        # Слабые ссылки не дают шаблонным именам ресурсов копить
+        # записи навсегда: кэш держит только живые объекты.
+        self._cache = WeakValueDictionary()
+
+    def __call__(
+        self,
+        resource: str,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> Psycopg2PGAdvisoryLock:
+        if block is None and lock_type is None and scope is None:
+            lock_fn = self._default_lock_fn
+        else:
+            lock_fn = get_lock_fn(
+                block if block is not None else self.block,
+                lock_type or self.lock_type,
+                scope or self.scope,
+            )
+        timeout = timeout or self.timeout
+        key = (resource, lock_fn, timeout)
+        lock = self._cache.get(key)
+        if lock is None:
+            lock = Psycopg2PGAdvisoryLock(
+                self.connection, resource, lock_fn,
+                timeout, self.delay, self.initial_delay,
+            )
+            self._cache[key] = lock
+        return lock
+
+    def acquire_many(
+        self,
+        resources,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> PGAdvisoryMultiLock:
+        if block is None and lock_type is None and scope is None:
+            lock_fn = self._default_lock_fn
+        else:
+            lock_fn = get_lock_fn(
+                block if block is not None else self.block,
+                lock_type or self.lock_type,
+                scope or self.scope,
+            )
+        return PGAdvisoryMultiLock(
+            self.connection, resources, lock_fn,
+            timeout or self.timeout, self.delay, self.initial_delay,
+        )
+
+
+class AcquirePsycopg3PGAdvisoryLock(AcquireLock):
+
+    __slots__ = (
+        'connection', 'block', 'timeout', 'lock_type', 'scope',
+        '_default_lock_fn', 'delay', 'initial_delay', '_cache',
+    )
+
+    def __init__(
+        self,
+        connection,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+    ):
+        self.connection = connection
+        self.block = block
+        self.timeout = timeout
+        self.lock_type = lock_type
+        self.scope = scope
+        # Частый случай — вызов без переопределений:
+        # имя функции для умолчаний считается один раз здесь.
+        self._default_lock_fn = get_lock_fn(block, lock_type, scope)
+        self.delay = delay
+        self.initial_delay = initial_delay
+        # Flyweight: объекты блокировок неизменяемы между захватами,
+        # повторный acquire того же ресурса переиспользует готовый.
+        # Слабые ссылки не дают шаблонным именам ресурсов копить
+        # записи навсегда: кэш держит только живые объекты.
+        self._cache = WeakValueDictionary()
+
+    def __call__(
+        self,
+        resource: str,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> Psycopg3PGAdvisoryLock:
+        if block is None and lock_type is None and scope is None:
+            lock_fn = self._default_lock_fn
+        else:
+            lock_fn = get_lock_fn(
+                block if block is not None else self.block,
+                lock_type or self.lock_type,
+                scope or self.scope,
+            )
+        timeout = timeout or self.timeout
+        key = (resource, lock_fn, timeout)
+        lock = self._cache.get(key)
+        if lock is None:
+            lock = Psycopg3PGAdvisoryLock(
+                self.connection, resource, lock_fn,
+                timeout, self.delay, self.initial_delay,
+            )
+            self._cache[key] = lock
+        return lock
+
+    def acquire_many(
+        self,
+        resources,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> PGAdvisoryMultiLock:
+        if block is None and lock_type is None and scope is None:
+            lock_fn = self._default_lock_fn
+        else:
+            lock_fn = get_lock_fn(
+                block if block is not None else self.block,
+                lock_type or self.lock_type,
+                scope or self.scope,
+            )
+        return PGAdvisoryMultiLock(
+            self.connection, resources, lock_fn,
+            timeout or self.timeout, self.delay, self.initial_delay,
+        )
+
+
+class AcquireSQLAlchemyPGAdvisoryLock(AcquireLock):
+
+    __slots__ = (
+        'session', 'block', 'timeout', 'lock_type', 'scope',
+        '_default_lock_fn', 'delay', 'initial_delay', 'taint_connections',
+        '_cache',
+    )
+
+    def __init__(
+        self,
+        session: Session,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+        taint_connections: bool = False,
+    ):
+        self.session = session
+        self.block = block
+        self.timeout = timeout
+        self.lock_type = lock_type
+        self.scope = scope
+        # Частый случай — вызов без переопределений:
+        # имя функции для умолчаний считается один раз здесь.
+        self._default_lock_fn = get_lock_fn(block, lock_type, scope)
+        self.delay = delay
+        self.initial_delay = initial_delay
+        # В паре с register_pool_listener: pg_advisory_unlock_all
+        # на checkin выполняется только для помеченных соединений.
+        self.taint_connections = taint_connections
+        # Flyweight: объекты блокировок неизменяемы между захватами,
+        # повторный acquire того же ресурса переиспользует готовый.
+        # Слабые ссылки не дают шаблонным именам ресурсов копить
+        # записи навсегда: кэш держит только живые объекты.
+        self._cache = WeakValueDictionary()
+
+    def __call__(
+        self,
+        resource: str,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> SQLAlchemyPGAdvisoryLock:
+        if block is None and lock_type is None and scope is None:
+            lock_fn = self._default_lock_fn
+        else:
+            lock_fn = get_lock_fn(
+                block if block is not None else self.block,
+                lock_type or self.lock_type,
+                scope or self.scope,
+            )
+        timeout = timeout or self.timeout
+        key = (resource, lock_fn, timeout)
+        lock = self._cache.get(key)
+        if lock is None:
+            lock = SQLAlchemyPGAdvisoryLock(
+                self.session, resource, lock_fn,
+                timeout, self.delay, self.initial_delay,
+                self.taint_connections,
+            )
+            self._cache[key] = lock
+        return lock
+
+    def acquire_many(
+        self,
+        resources,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> SQLAlchemyPGAdvisoryMultiLock:
+        if block is None and lock_type is None and scope is None:
+            lock_fn = self._default_lock_fn
+        else:
+            lock_fn = get_lock_fn(
+                block if block is not None else self.block,
+                lock_type or self.lock_type,
+                scope or self.scope,
+            )
+        return SQLAlchemyPGAdvisoryMultiLock(
+            self.session, resources, lock_fn,
+            timeout or self.timeout, self.delay, self.initial_delay,
+        )
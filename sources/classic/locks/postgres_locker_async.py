@@ -0,0 +1,508 @@
+import asyncio
+import random
+import time
+from typing import Optional
+from weakref import WeakValueDictionary
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import errors
+from .lock import (
+    EXCLUSIVE, SESSION,
+    AsyncLock, LockType, ScopeType,
+)
+from .postgres_locker import (
+    LOCK_FN_QUERY_TYPE_MAP, LOCK_FN_TABLE, SELECT_SQL, TRY_LOCK_FN_MAP,
+    UNLOCK_FN_MAP, WAIT_QUERY,
+    get_lock_fn, get_resource_id, get_select_stmt,
+)
+
+
+# asyncpg использует позиционные плейсхолдеры $N и принимает str.
+ASYNC_SELECT_SQL = {
+    fn: 'SELECT {}($1)'.format(fn)
+    for fn in {
+        *LOCK_FN_TABLE.values(),
+        *TRY_LOCK_FN_MAP.values(),
+        *(fn for fn in UNLOCK_FN_MAP.values() if fn),
+    }
+}
+
+
+class AsyncpgPGAdvisoryLock(AsyncLock):
+    """Advisory-блокировка поверх соединения asyncpg.
+
+    Паузы между попытками — await asyncio.sleep: один event loop
+    обслуживает сколько угодно ожидающих захватов.
+    """
+
+    __slots__ = (
+        'connection', 'resource', 'resource_id', 'lock_fn', 'try_lock_fn',
+        'unlock_fn', 'is_wait_query', 'timeout', 'delay', 'initial_delay',
+        '_lock_sql', '_wait_sql', '_unlock_sql', '_acquired',
+        '_reentries', '__weakref__',
+    )
+
+    def __init__(
+        self,
+        connection,
+        resource: str,
+        lock_fn: str,
+        timeout: Optional[int] = None,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+        resource_id: Optional[int] = None,
+    ):
+        self.connection = connection
+        self.resource = resource
+        self.resource_id = (
+            resource_id if resource_id is not None
+            else get_resource_id(resource)
+        )
+        self.lock_fn = lock_fn
+        self.try_lock_fn = TRY_LOCK_FN_MAP[lock_fn]
+        self.unlock_fn = UNLOCK_FN_MAP[lock_fn]
+        self.is_wait_query = (
+            LOCK_FN_QUERY_TYPE_MAP[lock_fn] == WAIT_QUERY
+        )
+        self.timeout = timeout
+        self.delay = delay
+        self.initial_delay = initial_delay
+        self._lock_sql = ASYNC_SELECT_SQL[self.try_lock_fn]
+        self._wait_sql = ASYNC_SELECT_SQL[lock_fn]
+        self._unlock_sql = (
+            ASYNC_SELECT_SQL[self.unlock_fn] if self.unlock_fn else None
+        )
+        self._acquired = False
+        self._reentries = 0
+
+    async def __aenter__(self):
+        # Повторный вход по удержанному ресурсу обслуживается локальным
+        # счетчиком — см. комментарий в _PsycopgPGAdvisoryLock.__enter__.
+        # Без него вложенный выход снимал бы блокировку, которую
+        # продолжает держать внешний контекст на том же flyweight.
+        if self.unlock_fn and self._acquired:
+            self._reentries += 1
+            return self
+        block = self.is_wait_query
+        if block and self.timeout is None:
+            # Без таймаута цикл не нужен: сервер сам будит бэкенд
+            # в момент освобождения — ровно один round-trip.
+            await self.connection.fetchval(
+                self._wait_sql, self.resource_id,
+            )
+            self._acquired = True
+            return self
+        deadline = (
+            time.monotonic() + self.timeout
+            if self.timeout is not None else None
+        )
+        delay = self.initial_delay
+        while True:
+            is_access = await self.connection.fetchval(
+                self._lock_sql, self.resource_id,
+            )
+            if is_access:
+                self._acquired = True
+                return self
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise errors.ResourceIsLocked(resource=self.resource)
+                await asyncio.sleep(
+                    min(delay + random.uniform(0, delay), remaining),
+                )
+            elif not block:
+                raise errors.ResourceIsLocked(resource=self.resource)
+            else:
+                await asyncio.sleep(delay + random.uniform(0, delay))
+            delay = min(delay * 2, self.delay)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._reentries:
+            self._reentries -= 1
+            return
+        if self.unlock_fn and self._acquired:
+            self._acquired = False
+            await self.connection.fetchval(
+                self._unlock_sql, self.resource_id,
+            )
+
+
+class Psycopg3AsyncPGAdvisoryLock(AsyncLock):
+    """Advisory-блокировка поверх psycopg.AsyncConnection.
+
+    Блокирующий захват ждет внутри бэкенда и будится сервером в момент
+    освобождения; в остальных случаях паузы между попытками —
+    await asyncio.sleep с экспоненциальным ростом и джиттером.
+    """
+
+    __slots__ = (
+        'connection', 'resource', 'resource_id', 'lock_fn', 'try_lock_fn',
+        'unlock_fn', 'is_wait_query', 'timeout', 'delay', 'initial_delay',
+        '_lock_sql', '_wait_sql', '_unlock_sql', '_acquired',
+        '_reentries', '__weakref__',
+    )
+
+    def __init__(
+        self,
+        connection,
+        resource: str,
+        lock_fn: str,
+        timeout: Optional[int] = None,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+        resource_id: Optional[int] = None,
+    ):
+        self.connection = connection
+        self.resource = resource
+        self.resource_id = (
+            resource_id if resource_id is not None
+            else get_resource_id(resource)
+        )
+        self.lock_fn = lock_fn
+        self.try_lock_fn = TRY_LOCK_FN_MAP[lock_fn]
+        self.unlock_fn = UNLOCK_FN_MAP[lock_fn]
+        self.is_wait_query = (
+            LOCK_FN_QUERY_TYPE_MAP[lock_fn] == WAIT_QUERY
+        )
+        self.timeout = timeout
+        self.delay = delay
+        self.initial_delay = initial_delay
+        self._lock_sql = SELECT_SQL[self.try_lock_fn]
+        self._wait_sql = SELECT_SQL[lock_fn]
+        self._unlock_sql = (
+            SELECT_SQL[self.unlock_fn] if self.unlock_fn else None
+        )
+        self._acquired = False
+        self._reentries = 0
+
+    async def __aenter__(self):
+        # Повторный вход по удержанному ресурсу обслуживается локальным
+        # счетчиком — см. комментарий в _PsycopgPGAdvisoryLock.__enter__.
+        # Без него вложенный выход снимал бы блокировку, которую
+        # продолжает держать внешний контекст на том же flyweight.
+        if self.unlock_fn and self._acquired:
+            self._reentries += 1
+            return self
+        block = self.is_wait_query
+        params = (self.resource_id,)
+        if block and self.timeout is None:
+            # Без таймаута цикл не нужен: сервер сам будит бэкенд
+            # в момент освобождения — ровно один round-trip.
+            await self.connection.execute(self._wait_sql, params)
+            self._acquired = True
+            return self
+        deadline = (
+            time.monotonic() + self.timeout
+            if self.timeout is not None else None
+        )
+        delay = self.initial_delay
+        while True:
+            cursor = await self.connection.execute(self._lock_sql, params)
+            row = await cursor.fetchone()
+            if row[0]:
+                self._acquired = True
+                return self
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise errors.ResourceIsLocked(resource=self.resource)
+                await asyncio.sleep(
+                    min(delay + random.uniform(0, delay), remaining),
+                )
+            elif not block:
+                raise errors.ResourceIsLocked(resource=self.resource)
+            else:
+                await asyncio.sleep(delay + random.uniform(0, delay))
+            delay = min(delay * 2, self.delay)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._reentries:
+            self._reentries -= 1
+            return
+        if self.unlock_fn and self._acquired:
+            self._acquired = False
+            await self.connection.execute(
+                self._unlock_sql, (self.resource_id,),
+            )
+
+    async def pipelined(self, do):
+        """Захват, работа и освобождение одним конвейером psycopg3.
+
+        В pipeline-режиме запросы короткой критической секции уходят
+        на сервер без ожидания ответа на каждый: вместо трех
+        round-trip (lock, работа, unlock) — один сетевой sync.
+        """
+        async with self.connection.pipeline():
+            async with self:
+                return await do(self.connection)
+
+
+class AsyncSQLAlchemyPGAdvisoryLock(AsyncLock):
+
+    __slots__ = (
+        'session', 'resource', 'resource_id', 'lock_fn', 'try_lock_fn',
+        'unlock_fn', 'is_wait_query', 'timeout', 'delay', 'initial_delay',
+        '_lock_stmt', '_wait_stmt', '_unlock_stmt', '_acquired',
+        '_reentries', '__weakref__',
+    )
+
+    def __init__(
+        self,
+        session: AsyncSession,
+        resource: str,
+        lock_fn: str,
+        timeout: Optional[int] = None,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+        resource_id: Optional[int] = None,
+    ):
+        self.session = session
+        self.resource = resource
+        self.resource_id = (
+            resource_id if resource_id is not None
+            else get_resource_id(resource)
+        )
+        self.lock_fn = lock_fn
+        self.try_lock_fn = TRY_LOCK_FN_MAP[lock_fn]
+        self.unlock_fn = UNLOCK_FN_MAP[lock_fn]
+        self.is_wait_query = (
+            LOCK_FN_QUERY_TYPE_MAP[lock_fn] == WAIT_QUERY
+        )
+        self.timeout = timeout
+        self.delay = delay
+        self.initial_delay = initial_delay
+        self._lock_stmt = get_select_stmt(self.try_lock_fn)
+        self._wait_stmt = get_select_stmt(lock_fn)
+        self._unlock_stmt = (
+            get_select_stmt(self.unlock_fn) if self.unlock_fn else None
+        )
+        self._acquired = False
+        self._reentries = 0
+
+    async def __aenter__(self):
+        # Повторный вход по удержанному ресурсу обслуживается локальным
+        # счетчиком — см. комментарий в _PsycopgPGAdvisoryLock.__enter__.
+        # Без него вложенный выход снимал бы блокировку, которую
+        # продолжает держать внешний контекст на том же flyweight.
+        if self.unlock_fn and self._acquired:
+            self._reentries += 1
+            return self
+        block = self.is_wait_query
+        params = {'id': self.resource_id}
+        if block and self.timeout is None:
+            # Без таймаута цикл не нужен: сервер сам будит бэкенд
+            # в момент освобождения — ровно один round-trip.
+            await self.session.execute(self._wait_stmt, params)
+            self._acquired = True
+            return self
+        deadline = (
+            time.monotonic() + self.timeout
+            if self.timeout is not None else None
+        )
+        delay = self.initial_delay
+        while True:
+            result = await self.session.execute(self._lock_stmt, params)
+            if result.scalar():
+                self._acquired = True
+                return self
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise errors.ResourceIsLocked(resource=self.resource)
+                await asyncio.sleep(
+                    min(delay + random.uniform(0, delay), remaining),
+                )
+            elif not block:
+                raise errors.ResourceIsLocked(resource=self.resource)
+            else:
+                await asyncio.sleep(delay + random.uniform(0, delay))
+            delay = min(delay * 2, self.delay)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._reentries:
+            self._reentries -= 1
+            return
+        if self.unlock_fn and self._acquired:
+            self._acquired = False
+            await self.session.execute(
+                self._unlock_stmt, {'id': self.resource_id},
+            )
+
+
+class AcquireAsyncpgPGAdvisoryLock:
+
+    __slots__ = (
+        'connection', 'block', 'timeout', 'lock_type', 'scope',
+        '_default_lock_fn', 'delay', 'initial_delay', '_cache',
+    )
+
+    def __init__(
+        self,
+        connection,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+    ):
+        self.connection = connection
+        self.block = block
+        self.timeout = timeout
+        self.lock_type = lock_type
+        self.scope = scope
+        # Частый случай — вызов без переопределений:
+        # имя функции для умолчаний считается один раз здесь.
+        self._default_lock_fn = get_lock_fn(block, lock_type, scope)
+        self.delay = delay
+        self.initial_delay = initial_delay
+        # Flyweight на слабых ссылках: шаблонные имена ресурсов
+        # не копят записи навсегда, кэш держит только живые объекты.
+        self._cache = WeakValueDictionary()
+
+    def __call__(
+        self,
+        resource: str,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> AsyncpgPGAdvisoryLock:
+        if block is None and lock_type is None and scope is None:
+            lock_fn = self._default_lock_fn
+        else:
+            lock_fn = get_lock_fn(
+                block if block is not None else self.block,
+                lock_type or self.lock_type,
+                scope or self.scope,
+            )
+        timeout = timeout or self.timeout
+        key = (resource, lock_fn, timeout)
+        lock = self._cache.get(key)
+        if lock is None:
+            lock = AsyncpgPGAdvisoryLock(
+                self.connection, resource, lock_fn,
+                timeout, self.delay, self.initial_delay,
+            )
+            self._cache[key] = lock
+        return lock
+
+
+class AcquirePsycopg3AsyncPGAdvisoryLock:
+
+    __slots__ = (
+        'connection', 'block', 'timeout', 'lock_type', 'scope',
+        '_default_lock_fn', 'delay', 'initial_delay', '_cache',
+    )
+
+    def __init__(
+        self,
+        connection,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+    ):
+        self.connection = connection
+        self.block = block
+        self.timeout = timeout
+        self.lock_type = lock_type
+        self.scope = scope
+        # Частый случай — вызов без переопределений:
+        # имя функции для умолчаний считается один раз здесь.
+        self._default_lock_fn = get_lock_fn(block, lock_type, scope)
+        self.delay = delay
+        self.initial_delay = initial_delay
+        # Flyweight на слабых ссылках: шаблонные имена ресурсов
+        # не копят записи навсегда, кэш держит только живые объекты.
+        self._cache = WeakValueDictionary()
+
+    def __call__(
+        self,
+        resource: str,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> Psycopg3AsyncPGAdvisoryLock:
+        if block is None and lock_type is None and scope is None:
+            lock_fn = self._default_lock_fn
+        else:
+            lock_fn = get_lock_fn(
+                block if block is not None else self.block,
+                lock_type or self.lock_type,
+                scope or self.scope,
+            )
+        timeout = timeout or self.timeout
+        key = (resource, lock_fn, timeout)
+        lock = self._cache.get(key)
+        if lock is None:
+            lock = Psycopg3AsyncPGAdvisoryLock(
+                self.connection, resource, lock_fn,
+                timeout, self.delay, self.initial_delay,
+            )
+            self._cache[key] = lock
+        return lock
+
+
+class AcquireAsyncSQLAlchemyPGAdvisoryLock:
+
+    __slots__ = (
+        'session', 'block', 'timeout', 'lock_type', 'scope',
+        '_default_lock_fn', 'delay', 'initial_delay', '_cache',
+    )
+
+    def __init__(
+        self,
+        session: AsyncSession,
+        block: bool = True,
+        timeout: Optional[int] = None,
+        lock_type: LockType = EXCLUSIVE,
+        scope: ScopeType = SESSION,
+        delay: float = 0.5,
+        initial_delay: float = 0.001,
+    ):
+        self.session = session
+        self.block = block
+        self.timeout = timeout
+        self.lock_type = lock_type
+        self.scope = scope
+        # Частый случай — вызов без переопределений:
+        # имя функции для умолчаний считается один раз здесь.
+        self._default_lock_fn = get_lock_fn(block, lock_type, scope)
+        self.delay = delay
+        self.initial_delay = initial_delay
+        # Flyweight на слабых ссылках: шаблонные имена ресурсов
+        # не копят записи навсегда, кэш держит только живые объекты.
+        self._cache = WeakValueDictionary()
+
+    def __call__(
+        self,
+        resource: str,
+        block: Optional[bool] = None,
+        timeout: Optional[int] = None,
+        lock_type: Optional[LockType] = None,
+        scope: Optional[ScopeType] = None,
+    ) -> AsyncSQLAlchemyPGAdvisoryLock:
+        if block is None and lock_type is None and scope is None:
+            lock_fn = self._default_lock_fn
+        else:
+            lock_fn = get_lock_fn(
+                block if block is not None else self.block,
+                lock_type or self.lock_type,
+                scope or self.scope,
+            )
+        timeout = timeout or self.timeout
+        key = (resource, lock_fn, timeout)
+        lock = self._cache.get(key)
+        if lock is None:
+            lock = AsyncSQLAlchemyPGAdvisoryLock(
+                self.session, resource, lock_fn,
+                timeout, self.delay, self.initial_delay,
+            )
+            self._cache[key] = lock
+        return lock
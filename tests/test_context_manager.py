@@ -0,0 +1,92 @@
+import pytest
+
+from classic.locks import (
+    EXCLUSIVE, SESSION, SHARED, AcquireLock, locking,
+)
+
+
+class StubLocker:
+    """Замена Mock(spec=AcquireLock): обычные вызовы методов вместо
+    __getattr__-интроспекции мока на каждое обращение."""
+
+    def __init__(self):
+        self.calls = []
+        self.enters = 0
+        self.exits = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        return self
+
+    def __enter__(self):
+        self.enters += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.exits += 1
+
+
+class SomeService:
+
+    def __init__(self, locker):
+        self.locker = locker
+
+    @locking('users:{user_id}')
+    def change_user(self, user_id: int):
+        return user_id
+
+    @locking('users', block=False, timeout=10, lock_type=SHARED)
+    def read_users(self):
+        return 'users'
+
+    @locking('users:{user_id}')
+    def change_user_twice(self, user_id: int):
+        return self.change_user(user_id=user_id)
+
+
+@pytest.fixture
+def locker():
+    return StubLocker()
+
+
+@pytest.fixture
+def service(locker):
+    return SomeService(locker)
+
+
+def test_locking_formats_resource(service, locker):
+    assert service.change_user(user_id=1) == 1
+
+    assert locker.calls == [(
+        ('users:1',),
+        dict(block=True, timeout=None, lock_type=EXCLUSIVE, scope=SESSION),
+    )]
+
+
+def test_locking_passes_lock_params(service, locker):
+    assert service.read_users() == 'users'
+
+    assert locker.calls == [(
+        ('users',),
+        dict(block=False, timeout=10, lock_type=SHARED, scope=SESSION),
+    )]
+
+
+def test_locking_releases_lock(service, locker):
+    service.change_user(user_id=1)
+
+    assert locker.enters == 1
+    assert locker.exits == 1
+
+
+def test_locking_is_reentrant(service, locker):
+    assert service.change_user_twice(user_id=1) == 1
+
+    # Вложенный вызов под тем же ресурсом не захватывает его повторно.
+    assert len(locker.calls) == 1
+
+
+def test_locking_adds_extra_annotation():
+    assert SomeService.change_user.__extra_annotations__ == {
+        'locker': AcquireLock,
+    }
@@ -0,0 +1,83 @@
+import sys
+
+import pytest
+
+from classic.locks import SHARED, FileLocker, errors
+
+
+# Проверка платформы на этапе сбора: модуль пропускается целиком,
+# без запуска autouse-фикстуры на каждом тесте.
+pytestmark = pytest.mark.skipif(
+    sys.platform != 'linux',
+    reason='FileLocker работает только на linux',
+)
+
+resource_1 = 'resource_1'
+
+
+# Локер создается один раз на модуль, а run_cleaner выполняется одним
+# проходом на teardown. Дескриптор у каждого захвата свой, поэтому
+# конфликты блокировок воспроизводятся и внутри одного локера.
+@pytest.fixture(scope='module')
+def file_locker(lock_dir):
+    locker = FileLocker(path=lock_dir)
+    yield locker
+    locker.run_cleaner()
+
+
+@pytest.fixture
+def excl_lock(file_locker):
+    return file_locker.acquire(resource_1, block=False)
+
+
+@pytest.fixture
+def excl_lock_2(file_locker):
+    return file_locker.acquire(resource_1, block=False)
+
+
+@pytest.fixture
+def shared_lock(file_locker):
+    return file_locker.acquire(
+        resource_1, block=False, lock_type=SHARED,
+    )
+
+
+@pytest.fixture
+def shared_lock_2(file_locker):
+    return file_locker.acquire(
+        resource_1, block=False, lock_type=SHARED,
+    )
+
+
+def test_exclusive_blocks_exclusive(excl_lock, excl_lock_2):
+    with excl_lock:
+        with pytest.raises(errors.ResourceIsLocked):
+            with excl_lock_2:
+                pass
+
+
+def test_shared_allows_shared(shared_lock, shared_lock_2):
+    with shared_lock:
+        with shared_lock_2:
+            pass
+
+
+def test_exclusive_blocks_shared(excl_lock, shared_lock):
+    with excl_lock:
+        with pytest.raises(errors.ResourceIsLocked):
+            with shared_lock:
+                pass
+
+
+def test_shared_blocks_exclusive(shared_lock, excl_lock):
+    with shared_lock:
+        with pytest.raises(errors.ResourceIsLocked):
+            with excl_lock:
+                pass
+
+
+def test_lock_released_on_exit(excl_lock, excl_lock_2):
+    with excl_lock:
+        pass
+    with excl_lock_2:
+        pass
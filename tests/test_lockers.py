@@ -0,0 +1,96 @@
+import pytest
+
+from classic.locks import SHARED, FileLocker, errors
+from classic.locks.postgres_locker import AcquireSQLAlchemyPGAdvisoryLock
+
+
+resource = 'resource_1'
+another_resource = 'resource_2'
+
+
+# Явные id и группы xdist: при `pytest -n auto --dist=loadgroup`
+# каждый бэкенд целиком достается одному воркеру, и сессия Postgres
+# не делится между процессами.
+LOCKERS = [
+    pytest.param(
+        (AcquireSQLAlchemyPGAdvisoryLock, 'session', 'session_2'),
+        id='pg',
+        marks=[
+            pytest.mark.xdist_group(name='pg'),
+            pytest.mark.postgres,
+        ],
+    ),
+    pytest.param(
+        (FileLocker, 'lock_dir', 'lock_dir'),
+        id='file',
+        marks=pytest.mark.xdist_group(name='file'),
+    ),
+]
+
+
+@pytest.fixture(params=LOCKERS)
+def locker_fixture(request):
+    return request.param
+
+
+# Разбор кортежа и оба getfixturevalue выполняются один раз здесь,
+# а не трехстрочным прологом в каждом тесте.
+@pytest.fixture
+def env(request, locker_fixture):
+    locker, conn_1_name, conn_2_name = locker_fixture
+    return (
+        locker(request.getfixturevalue(conn_1_name)),
+        locker(request.getfixturevalue(conn_2_name)),
+    )
+
+
+def test_exclusive_blocks_exclusive(env):
+    locker_1, locker_2 = env
+
+    with locker_1(resource):
+        with pytest.raises(errors.ResourceIsLocked):
+            with locker_2(resource, block=False):
+                pass
+
+
+def test_lock_released_on_exit(env):
+    locker_1, locker_2 = env
+
+    with locker_1(resource):
+        pass
+    with locker_2(resource, block=False):
+        pass
+
+
+def test_shared_allows_shared(env):
+    locker_1, locker_2 = env
+
+    with locker_1(resource, lock_type=SHARED):
+        with locker_2(resource, block=False, lock_type=SHARED):
+            pass
+
+
+def test_shared_blocks_exclusive(env):
+    locker_1, locker_2 = env
+
+    with locker_1(resource, lock_type=SHARED):
+        with pytest.raises(errors.ResourceIsLocked):
+            with locker_2(resource, block=False):
+                pass
+
+
+def test_exclusive_blocks_shared(env):
+    locker_1, locker_2 = env
+
+    with locker_1(resource):
+        with pytest.raises(errors.ResourceIsLocked):
+            with locker_2(resource, block=False, lock_type=SHARED):
+                pass
+
+
+def test_different_resources_do_not_conflict(env):
+    locker_1, locker_2 = env
+
+    with locker_1(resource):
+        with locker_2(another_resource, block=False):
+            pass
@@ -0,0 +1,52 @@
+import pytest
+
+from classic.locks.mssql_locker import supports_optimized_locking
+
+
+class StubCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql):
+        self.connection.queries.append(sql)
+
+    def fetchone(self):
+        return (self.connection.property_value,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class StubConnection:
+
+    def __init__(self, property_value):
+        self.property_value = property_value
+        self.queries = []
+
+    def cursor(self):
+        return StubCursor(self)
+
+
+@pytest.mark.parametrize('property_value,expected', [
+    (1, True),
+    (0, False),
+    # Версии без Optimized Locking возвращают NULL.
+    (None, False),
+])
+def test_detects_optimized_locking(property_value, expected):
+    connection = StubConnection(property_value)
+
+    assert supports_optimized_locking(connection) is expected
+
+
+def test_answer_is_cached_per_connection():
+    connection = StubConnection(1)
+
+    supports_optimized_locking(connection)
+    supports_optimized_locking(connection)
+
+    assert len(connection.queries) == 1
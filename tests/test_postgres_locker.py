@@ -0,0 +1,58 @@
+import pytest
+
+from classic.locks import SHARED, TRANSACTION, errors
+from classic.locks.postgres_locker import AcquireSQLAlchemyPGAdvisoryLock
+
+
+# Без поднятого Postgres метку пропускает conftest на этапе сбора.
+pytestmark = pytest.mark.postgres
+
+
+resource = 'resource_1'
+
+
+@pytest.fixture
+def locker(session):
+    return AcquireSQLAlchemyPGAdvisoryLock(session)
+
+
+@pytest.fixture
+def locker_2(session_2):
+    return AcquireSQLAlchemyPGAdvisoryLock(session_2)
+
+
+def test_exclusive_blocks_exclusive(locker, locker_2):
+    with locker(resource):
+        with pytest.raises(errors.ResourceIsLocked):
+            with locker_2(resource, block=False):
+                pass
+
+
+def test_shared_allows_shared(locker, locker_2):
+    with locker(resource, lock_type=SHARED):
+        with locker_2(resource, block=False, lock_type=SHARED):
+            pass
+
+
+def test_lock_released_on_exit(locker, locker_2):
+    with locker(resource):
+        pass
+    with locker_2(resource, block=False):
+        pass
+
+
+def test_transaction_scope_released_on_commit(
+    engine, session_factory, locker_2,
+):
+    # xact-блокировку снимает только конец верхнеуровневой транзакции,
+    # а commit на общем SAVEPOINT-соединении лишь освобождает точку
+    # сохранения — поэтому здесь отдельное короткоживущее соединение.
+    with engine.connect() as connection:
+        session = session_factory(bind=connection)
+        locker = AcquireSQLAlchemyPGAdvisoryLock(session)
+        with locker(resource, scope=TRANSACTION):
+            pass
+        session.commit()
+        session.close()
+    with locker_2(resource, block=False):
+        pass
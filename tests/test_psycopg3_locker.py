@@ -0,0 +1,63 @@
+import pytest
+
+from classic.locks import errors
+from classic.locks.postgres_locker import Psycopg3PGAdvisoryLock
+
+
+resource = 'resource_1'
+
+
+class StubCursor:
+    """Подражает курсору psycopg3: бинарный формат результата требует
+    расширенного протокола, который не принимает несколько операторов
+    одной командой."""
+
+    def __init__(self, connection, binary):
+        self.connection = connection
+        self.binary = binary
+
+    def execute(self, sql, params=None, prepare=None):
+        assert not (self.binary and b';' in sql), (
+            'многооператорный батч на бинарном курсоре'
+        )
+        self.connection.queries.append(sql)
+        return self
+
+    def fetchone(self):
+        return (True,)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class StubConnection:
+
+    autocommit = False
+
+    def __init__(self):
+        self.queries = []
+
+    def cursor(self, binary=False):
+        return StubCursor(self, binary)
+
+
+@pytest.fixture
+def connection():
+    return StubConnection()
+
+
+def test_lock_timeout_batches_bypass_binary_cursor(connection):
+    lock = Psycopg3PGAdvisoryLock(
+        connection, resource, 'pg_advisory_lock', timeout=1,
+    )
+    with lock:
+        pass
+
+    assert any(b'SAVEPOINT' in query for query in connection.queries)
+    assert any(b'pg_advisory_unlock' in query for query in connection.queries)